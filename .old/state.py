@@ -6,10 +6,130 @@ Maintains a key-value store accessible via MQTT commands.
 import paho.mqtt.client as Client
 import json
 import time
+import threading
 from loguru import logger
 from typing import Dict, Any, Optional, Literal
 
 
+_TRUTHY = frozenset({"true", "1", "yes", "t", "y", "on"})
+
+
+def _to_bool(value: Any) -> bool:
+    """Convert a value to bool, treating common truthy strings as True."""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        return value.lower() in _TRUTHY
+    return bool(value)
+
+
+_TYPE_CONVERTERS = {"int": int, "float": float, "str": str, "bool": _to_bool}
+
+# Fixed replies, serialized once at import
+_OK_BYTES = json.dumps({"result": "ok"}).encode()
+_ERR_MISSING_KEY_BYTES = json.dumps({"result": "error", "error": "Missing 'key' parameter"}).encode()
+_ERR_MISSING_VALUE_BYTES = json.dumps({"result": "error", "error": "Missing 'value' parameter"}).encode()
+
+_HELP_DETAILS = {
+    "description": "State management system with key-value storage",
+    "features": [
+        "Key-value storage with type support",
+        "Supported types: int, float, str, bool",
+        "Get entire state or specific keys",
+        "Add/update state values with type conversion",
+        "Delete state values"
+    ],
+    "commands": {
+        "get": {
+            "description": "Get the entire state or a specific key value",
+            "parameters": {
+                "cmd": "'get' (required)",
+                "key": "Key name (optional - if omitted, returns entire state)"
+            },
+            "examples": [
+                {
+                    "description": "Get entire state",
+                    "command": {"cmd": "get"},
+                    "response": {"result": {"key1": "value1", "key2": 123}}
+                },
+                {
+                    "description": "Get specific key",
+                    "command": {"cmd": "get", "key": "name"},
+                    "response": {"result": "value"}
+                }
+            ]
+        },
+        "add": {
+            "description": "Add or update a state value with type conversion",
+            "parameters": {
+                "cmd": "'add' (required)",
+                "key": "Key name (required)",
+                "value": "Value to store (required)",
+                "type": "Value type: 'int', 'float', 'str', or 'bool' (optional, default: 'str')"
+            },
+            "examples": [
+                {
+                    "description": "Add string value",
+                    "command": {"cmd": "add", "key": "name", "value": "John"},
+                    "response": {"result": "ok"}
+                },
+                {
+                    "description": "Add integer value",
+                    "command": {"cmd": "add", "key": "age", "value": "25", "type": "int"},
+                    "response": {"result": "ok"}
+                },
+                {
+                    "description": "Add boolean value",
+                    "command": {"cmd": "add", "key": "active", "value": "true", "type": "bool"},
+                    "response": {"result": "ok"}
+                }
+            ]
+        },
+        "del": {
+            "description": "Delete a key from the state",
+            "parameters": {
+                "cmd": "'del' (required)",
+                "key": "Key name to delete (required)"
+            },
+            "examples": [
+                {
+                    "description": "Delete a key",
+                    "command": {"cmd": "del", "key": "name"},
+                    "response": {"result": "ok"}
+                }
+            ]
+        },
+        "help": {
+            "description": "Get help information about the state manager",
+            "parameters": {
+                "cmd": "'help' (required)"
+            },
+            "examples": [
+                {
+                    "description": "Get help",
+                    "command": {"cmd": "help"},
+                    "response": {"info": "..."}
+                }
+            ]
+        }
+    },
+    "workflow": [
+        "1. Add values to state: {\"cmd\": \"add\", \"key\": \"counter\", \"value\": \"0\", \"type\": \"int\"}",
+        "2. Get specific value: {\"cmd\": \"get\", \"key\": \"counter\"}",
+        "3. Get entire state: {\"cmd\": \"get\"}",
+        "4. Update value: {\"cmd\": \"add\", \"key\": \"counter\", \"value\": \"1\", \"type\": \"int\"}",
+        "5. Delete value: {\"cmd\": \"del\", \"key\": \"counter\"}",
+        "6. To get help: {\"cmd\": \"help\"}"
+    ],
+    "notes": [
+        "All responses are sent to the STATE topic",
+        "Type conversion errors will return an error response",
+        "Deleting non-existent keys returns 'ok' with a warning",
+        "Getting non-existent keys returns null with an error message"
+    ]
+}
+
+
 class StateManager:
     """
     State management system with MQTT interface.
@@ -22,12 +142,31 @@ class StateManager:
     - MQTT command interface on STATE topic
     """
 
-    def __init__(self, mqtt_port: int):
+    __slots__ = (
+        "_state",
+        "_mqtt_port",
+        "_mqtt_client",
+        "_mqtt_connected",
+        "_running",
+        "_batch_ms",
+        "_ack_qos",
+        "_outbox",
+        "_outbox_lock",
+        "_flush_thread",
+        "_stop_event",
+        "_help_bytes",
+        "_topic_handlers",
+        "_handlers",
+    )
+
+    def __init__(self, mqtt_port: int, batch_ms: int = 0, ack_qos: int = 0):
         """
         Initialize the StateManager.
 
         Args:
             mqtt_port: Port for MQTT broker connection
+            batch_ms: Flush interval for batched replies (0 = publish each reply immediately)
+            ack_qos: QoS for replies on STATE (set to 1 for at-least-once replies)
         """
         # State storage
         self._state: Dict[str, Any] = {
@@ -44,61 +183,95 @@ class StateManager:
 
         # MQTT setup
         self._mqtt_port = mqtt_port
-        self._mqtt_client = Client.Client(Client.CallbackAPIVersion.VERSION1, "state_client")
+        self._mqtt_client = Client.Client(Client.CallbackAPIVersion.VERSION2, "state_client")
         self._mqtt_client.on_connect = self._on_mqtt_connect
         self._mqtt_client.on_message = self._on_mqtt_message
         self._mqtt_connected = False
         self._running = False
 
-    def _on_mqtt_connect(self, client, userdata, flags, rc):
+        # Outbound reply batching (opt-in)
+        self._batch_ms = batch_ms
+        self._ack_qos = ack_qos
+        self._outbox: list[tuple[str, bytes]] = []  # (topic, serialized reply)
+        self._outbox_lock = threading.Lock()
+        self._flush_thread: Optional[threading.Thread] = None
+
+        # Set when the StateManager stops so waiters wake without polling
+        self._stop_event = threading.Event()
+
+        # Help payload never changes, serialize it once
+        self._help_bytes = json.dumps({"info": _HELP_DETAILS}).encode()
+
+        # Dispatch tables for incoming topics and STATE commands
+        self._topic_handlers = {
+            "APP": self._handle_app_msg,
+            "STATE": self._handle_state_msg,
+        }
+        self._handlers = {
+            "get": self._handle_get,
+            "add": self._handle_add,
+            "del": self._handle_delete,
+            "help": lambda _: self._handle_help(),
+        }
+
+    def _on_mqtt_connect(self, client, userdata, flags, reason_code, properties):
         """Callback when MQTT client connects."""
-        if rc == 0:
+        if reason_code == 0:
             logger.info("StateManager connected to MQTT broker")
             client.subscribe("STATE", qos=1)
             client.subscribe("APP", qos=1)
             logger.info("StateManager subscribed to STATE and APP topics")
             self._mqtt_connected = True
         else:
-            logger.error(f"StateManager failed to connect to MQTT broker, return code: {rc}")
+            logger.error(f"StateManager failed to connect to MQTT broker, reason code: {reason_code}")
 
     def _on_mqtt_message(self, client, userdata, message):
         """Handle incoming MQTT messages."""
+        topic = message.topic
+        # json.loads accepts bytes, so only decode when debug logging wants it
+        payload = message.payload
+        logger.opt(lazy=True).debug(
+            "StateManager received message on {}: {}",
+            lambda: topic,
+            lambda: payload.decode(errors="replace"),
+        )
+
+        topic_handler = self._topic_handlers.get(topic)
+        if topic_handler is None:
+            return
+
+        # All commands are JSON objects, skip anything else without parsing
+        if payload[:1] != b"{":
+            logger.warning("Received non-JSON message on {}: {}", topic, payload.decode(errors="replace"))
+            return
+
         try:
-            payload = message.payload.decode()
-            logger.debug(f"StateManager received message on {message.topic}: {payload}")
-
-            # Handle CLOSE command on APP topic
-            if message.topic == "APP":
-                try:
-                    cmd_data = json.loads(payload)
-                    if cmd_data.get("cmd") == "CLOSE":
-                        logger.info("StateManager received CLOSE command")
-                        self.stop()
-                        return
-                except json.JSONDecodeError:
-                    pass
-                return
+            cmd_data = json.loads(payload)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            logger.warning("Received non-JSON message on {}: {}", topic, payload.decode(errors="replace"))
+            return
 
-            # Handle STATE topic commands
-            try:
-                cmd_data = json.loads(payload)
-                cmd = cmd_data.get("cmd")
-
-                if cmd == "get":
-                    self._handle_get(cmd_data)
-                elif cmd == "add":
-                    self._handle_add(cmd_data)
-                elif cmd == "del":
-                    self._handle_delete(cmd_data)
-                elif cmd == "help":
-                    self._handle_help()
-                else:
-                    logger.warning(f"Unknown command: {cmd}")
-
-            except json.JSONDecodeError:
-                logger.warning(f"Received non-JSON message: {payload}")
+        try:
+            topic_handler(cmd_data)
         except Exception as e:
-            logger.error(f"Error processing MQTT message: {e}")
+            # Keep a bad command from killing paho's network thread
+            logger.error("Error processing MQTT message: {}", e)
+
+    def _handle_app_msg(self, cmd_data: Dict[str, Any]):
+        """Handle CLOSE command on APP topic."""
+        if cmd_data.get("cmd") == "CLOSE":
+            logger.info("StateManager received CLOSE command")
+            self.stop()
+
+    def _handle_state_msg(self, cmd_data: Dict[str, Any]):
+        """Handle STATE topic commands."""
+        cmd = cmd_data.get("cmd")
+
+        handler = self._handlers.get(cmd)
+        if handler:
+            handler(cmd_data)
+        else:
+            logger.warning("Unknown command: {}", cmd)
 
     def _handle_get(self, cmd_data: Dict[str, Any]):
         """Handle get command."""
@@ -115,7 +288,7 @@ class StateManager:
                 result = {"result": None, "error": f"Key '{key}' not found"}
 
         self.emit("STATE", result)
-        logger.debug(f"Get command - key: {key}, result: {result}")
+        logger.debug("Get command - key: {}, result: {}", key, result)
 
     def _handle_add(self, cmd_data: Dict[str, Any]):
         """Handle add command."""
@@ -124,172 +297,98 @@ class StateManager:
         value_type = cmd_data.get("type", "str")
 
         if key is None:
-            result = {"result": "error", "error": "Missing 'key' parameter"}
-            self.emit("STATE", result)
+            self._publish_raw("STATE", _ERR_MISSING_KEY_BYTES)
             logger.error("Add command missing 'key' parameter")
             return
 
         if value is None:
-            result = {"result": "error", "error": "Missing 'value' parameter"}
-            self.emit("STATE", result)
+            self._publish_raw("STATE", _ERR_MISSING_VALUE_BYTES)
             logger.error("Add command missing 'value' parameter")
             return
 
-        # Convert value to specified type
+        # Convert value to specified type (unknown types default to string)
         try:
-            if value_type == "int":
-                converted_value = int(value)
-            elif value_type == "float":
-                converted_value = float(value)
-            elif value_type == "bool":
-                if isinstance(value, bool):
-                    converted_value = value
-                elif isinstance(value, str):
-                    converted_value = value.lower() in ("true", "1", "yes")
-                else:
-                    converted_value = bool(value)
-            else:  # Default to string
-                converted_value = str(value)
+            converted_value = _TYPE_CONVERTERS.get(value_type, str)(value)
 
             self._state[key] = converted_value
-            result = {"result": "ok"}
-            self.emit("STATE", result)
-            logger.info(f"Added state - key: {key}, value: {converted_value}, type: {value_type}")
+            self._publish_raw("STATE", _OK_BYTES)
+            logger.info("Added state - key: {}, value: {}, type: {}", key, converted_value, value_type)
 
         except (ValueError, TypeError) as e:
             result = {"result": "error", "error": f"Failed to convert value to {value_type}: {e}"}
             self.emit("STATE", result)
-            logger.error(f"Type conversion error: {e}")
+            logger.error("Type conversion error: {}", e)
 
     def _handle_delete(self, cmd_data: Dict[str, Any]):
         """Handle delete command."""
         key = cmd_data.get("key")
 
         if key is None:
-            result = {"result": "error", "error": "Missing 'key' parameter"}
-            self.emit("STATE", result)
+            self._publish_raw("STATE", _ERR_MISSING_KEY_BYTES)
             logger.error("Delete command missing 'key' parameter")
             return
 
         if key in self._state:
             del self._state[key]
-            result = {"result": "ok"}
-            logger.info(f"Deleted state key: {key}")
+            self._publish_raw("STATE", _OK_BYTES)
+            logger.info("Deleted state key: {}", key)
         else:
             result = {"result": "ok", "warning": f"Key '{key}' not found"}
-            logger.debug(f"Delete command - key '{key}' not found")
-
-        self.emit("STATE", result)
+            self.emit("STATE", result)
+            logger.debug("Delete command - key '{}' not found", key)
 
     def _handle_help(self):
         """Handle help command."""
-        help_details = {
-            "description": "State management system with key-value storage",
-            "features": [
-                "Key-value storage with type support",
-                "Supported types: int, float, str, bool",
-                "Get entire state or specific keys",
-                "Add/update state values with type conversion",
-                "Delete state values"
-            ],
-            "commands": {
-                "get": {
-                    "description": "Get the entire state or a specific key value",
-                    "parameters": {
-                        "cmd": "'get' (required)",
-                        "key": "Key name (optional - if omitted, returns entire state)"
-                    },
-                    "examples": [
-                        {
-                            "description": "Get entire state",
-                            "command": {"cmd": "get"},
-                            "response": {"result": {"key1": "value1", "key2": 123}}
-                        },
-                        {
-                            "description": "Get specific key",
-                            "command": {"cmd": "get", "key": "name"},
-                            "response": {"result": "value"}
-                        }
-                    ]
-                },
-                "add": {
-                    "description": "Add or update a state value with type conversion",
-                    "parameters": {
-                        "cmd": "'add' (required)",
-                        "key": "Key name (required)",
-                        "value": "Value to store (required)",
-                        "type": "Value type: 'int', 'float', 'str', or 'bool' (optional, default: 'str')"
-                    },
-                    "examples": [
-                        {
-                            "description": "Add string value",
-                            "command": {"cmd": "add", "key": "name", "value": "John"},
-                            "response": {"result": "ok"}
-                        },
-                        {
-                            "description": "Add integer value",
-                            "command": {"cmd": "add", "key": "age", "value": "25", "type": "int"},
-                            "response": {"result": "ok"}
-                        },
-                        {
-                            "description": "Add boolean value",
-                            "command": {"cmd": "add", "key": "active", "value": "true", "type": "bool"},
-                            "response": {"result": "ok"}
-                        }
-                    ]
-                },
-                "del": {
-                    "description": "Delete a key from the state",
-                    "parameters": {
-                        "cmd": "'del' (required)",
-                        "key": "Key name to delete (required)"
-                    },
-                    "examples": [
-                        {
-                            "description": "Delete a key",
-                            "command": {"cmd": "del", "key": "name"},
-                            "response": {"result": "ok"}
-                        }
-                    ]
-                },
-                "help": {
-                    "description": "Get help information about the state manager",
-                    "parameters": {
-                        "cmd": "'help' (required)"
-                    },
-                    "examples": [
-                        {
-                            "description": "Get help",
-                            "command": {"cmd": "help"},
-                            "response": {"info": "..."}
-                        }
-                    ]
-                }
-            },
-            "workflow": [
-                "1. Add values to state: {\"cmd\": \"add\", \"key\": \"counter\", \"value\": \"0\", \"type\": \"int\"}",
-                "2. Get specific value: {\"cmd\": \"get\", \"key\": \"counter\"}",
-                "3. Get entire state: {\"cmd\": \"get\"}",
-                "4. Update value: {\"cmd\": \"add\", \"key\": \"counter\", \"value\": \"1\", \"type\": \"int\"}",
-                "5. Delete value: {\"cmd\": \"del\", \"key\": \"counter\"}",
-                "6. To get help: {\"cmd\": \"help\"}"
-            ],
-            "notes": [
-                "All responses are sent to the STATE topic",
-                "Type conversion errors will return an error response",
-                "Deleting non-existent keys returns 'ok' with a warning",
-                "Getting non-existent keys returns null with an error message"
-            ]
-        }
-        help_message = {"info": help_details}
-        self.emit("STATE", help_message)
+        self._publish_raw("STATE", self._help_bytes)
         logger.info("Sent help message to STATE topic")
 
+    def _publish_raw(self, topic: str, payload: bytes):
+        """Publish an already-serialized payload via MQTT, or queue it when batching is enabled.
+
+        Queued replies share the outbox with emit() so they go out in the order
+        they were produced.
+        """
+        if not self._mqtt_connected:
+            return
+        if self._batch_ms > 0:
+            with self._outbox_lock:
+                self._outbox.append((topic, payload))
+            return
+        self._mqtt_client.publish(topic, payload, qos=self._ack_qos)
+
     def emit(self, topic: str, data: Dict[str, Any]):
-        """Emit a message via MQTT."""
-        if self._mqtt_connected:
-            message = json.dumps(data)
-            self._mqtt_client.publish(topic, message, qos=1)
+        """Emit a message via MQTT, or queue it when batching is enabled."""
+        self._publish_raw(topic, json.dumps(data).encode())
+
+    def _flush_outbox(self):
+        """Publish queued replies, one message per topic.
+
+        A single queued reply is sent as-is so consumers see the same shape
+        as unbatched replies; multiple replies are sent as a JSON array.
+        """
+        with self._outbox_lock:
+            if not self._outbox:
+                return
+            batch, self._outbox = self._outbox, []
+
+        by_topic: Dict[str, list] = {}
+        for topic, payload in batch:
+            by_topic.setdefault(topic, []).append(payload)
+
+        # Replies are already serialized, so splice them into the array directly
+        for topic, payloads in by_topic.items():
+            payload = payloads[0] if len(payloads) == 1 else b"[" + b", ".join(payloads) + b"]"
+            self._mqtt_client.publish(topic, payload, qos=self._ack_qos)
+
+    def _flush_loop(self):
+        """Periodically drain the outbox while running."""
+        interval = self._batch_ms / 1000
+        while self._running:
+            time.sleep(interval)
+            try:
+                self._flush_outbox()
+            except Exception as e:
+                logger.error(f"Error flushing outbox: {e}")
 
     def start(self):
         """Start the StateManager and connect to MQTT."""
@@ -298,6 +397,7 @@ class StateManager:
             return
 
         self._running = True
+        self._stop_event.clear()
 
         # Connect to MQTT broker
         try:
@@ -307,8 +407,13 @@ class StateManager:
         except Exception as e:
             logger.error(f"Failed to connect to MQTT broker: {e}")
             self._running = False
+            self._stop_event.set()
             return
 
+        if self._batch_ms > 0:
+            self._flush_thread = threading.Thread(target=self._flush_loop, daemon=True)
+            self._flush_thread.start()
+
     def stop(self):
         """Stop the StateManager."""
         if not self._running:
@@ -316,6 +421,12 @@ class StateManager:
 
         self._running = False
 
+        # Send anything still queued before disconnecting
+        if self._batch_ms > 0:
+            self._flush_outbox()
+
+        self._stop_event.set()
+
         # Stop MQTT client
         if self._mqtt_client:
             self._mqtt_client.loop_stop()
@@ -347,9 +458,8 @@ def state_process(port: int, enable_logging: bool = False):
     state_manager.start()
 
     try:
-        # Keep the process running
-        while state_manager.is_running():
-            time.sleep(1)
+        # Keep the process running until stop() is called
+        state_manager._stop_event.wait()
     except KeyboardInterrupt:
         logger.info("StateManager interrupted")
     finally:
@@ -203,6 +203,9 @@ def check_mqtt_messages():
                 if key in APP_STATE.keys():
                     APP_STATE[key] = value
                     state_changed()
+            elif data.get("cmd") == "get":
+                # A process (e.g. the typer) asked for the current state
+                publish_app_state()
 
         # Handle LISTENER topic messages
         elif topic == "LISTENER":
@@ -873,7 +876,7 @@ def main():
             available_port = args.port
             logger.info(f"Using specified port: {available_port}")
         else:
-            available_port = get_random_available_port()
+            available_port = get_random_available_port(broker_host)
             logger.info(f"Random port: {available_port}")
 
     # Start child processes
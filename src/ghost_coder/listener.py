@@ -7,6 +7,7 @@ from pynput import keyboard, mouse
 from inputs import get_gamepad, devices
 import threading
 import time
+import signal
 import paho.mqtt.client as Client
 from typing import Optional, Literal, Dict, Any, List
 from dataclasses import dataclass
@@ -14,6 +15,96 @@ from enum import Enum
 from loguru import logger
 import json
 
+try:
+    # orjson parses bytes directly and is several times faster than json. It is a
+    # declared dependency everywhere but 32-bit x86, which has no orjson wheels
+    from orjson import loads as json_loads, dumps as json_dumps, JSONDecodeError
+except ImportError:
+    from json import loads as json_loads, JSONDecodeError
+
+    def json_dumps(obj: Any) -> bytes:
+        return json.dumps(obj).encode()
+
+
+# Help text for the LISTENER "help" command; it never changes, so it is serialized once
+_HELP_DETAILS = {
+    "description": "Global input listener supporting keyboard, mouse, and gamepad hotkeys",
+    "features": [
+        "8 hotkey slots (1-8)",
+        "Multiple input sources (keyboard, mouse, gamepad)",
+        "Auto-select first available gamepad",
+        "Custom message attachment",
+        "Event suppression (prevent OS from seeing event)"
+    ],
+    "commands": {
+        "register": {
+            "description": "Register a hotkey for a specific slot",
+            "parameters": {
+                "cmd": "'register' (required)",
+                "slot": "Hotkey slot number (1-8, required)",
+                "input": "Input source: 'keyboard', 'mouse', or 'gamepad' (required)",
+                "suppress": "Whether to suppress the event (boolean, required)"
+            },
+            "example": {
+                "cmd": "register",
+                "slot": 1,
+                "input": "keyboard",
+                "suppress": False
+            }
+        },
+        "unregister": {
+            "description": "Unregister/clear a hotkey slot",
+            "parameters": {
+                "cmd": "'unregister' (required)",
+                "slot": "Hotkey slot number (1-8, required)"
+            },
+            "example": {
+                "cmd": "unregister",
+                "slot": 1
+            }
+        },
+        "help": {
+            "description": "Get help information about the listener",
+            "parameters": {
+                "cmd": "'help' (required)"
+            },
+            "example": {
+                "cmd": "help"
+            }
+        }
+    },
+    "events": {
+        "hotkey_triggered": {
+            "description": "Emitted when a registered hotkey is triggered",
+            "topic": "LISTENER",
+            "fields": {
+                "event": "'hotkey_triggered'",
+                "slot": "Hotkey slot number (1-8)",
+                "source": "Input source ('keyboard', 'mouse', or 'gamepad')",
+                "value": "The key/button/code that was pressed",
+                "gamepad_name": "Gamepad device name (if source is gamepad)",
+                "message": "Custom message (if configured)"
+            },
+            "example": {
+                "event": "hotkey_triggered",
+                "slot": 1,
+                "source": "keyboard",
+                "value": "a",
+                "message": "My custom action"
+            }
+        }
+    },
+    "workflow": [
+        "1. Send registration to LISTENER topic: {\"cmd\": \"register\", \"slot\": 1, \"input\": \"keyboard\", \"suppress\": false}",
+        "2. Press the key/button/gamepad input you want to register",
+        "3. Listener will confirm registration via log",
+        "4. When you press that input again, a 'hotkey_triggered' event is emitted to LISTENER topic",
+        "5. To unregister: send {\"cmd\": \"unregister\", \"slot\": 1}",
+        "6. To get help: send {\"cmd\": \"help\"}"
+    ]
+}
+_HELP_PAYLOAD_BYTES = json_dumps({"info": _HELP_DETAILS})
+
 
 # Force refresh of device list before enumerating
 def refresh_gamepad_devices():
@@ -67,6 +158,7 @@ class Listener:
         self._lock = threading.Lock()
         self._hotkeys: Dict[int, Optional[HotkeyEvent]] = {i: None for i in range(1, 9)}
         self._running = False
+        self._shutdown_event = threading.Event()  # Set by request_shutdown() or stop()
 
         # Recording state
         self._recording_slot: Optional[int] = None
@@ -104,6 +196,13 @@ class Listener:
         # Track inputs that were just registered (to suppress immediate trigger)
         self._just_registered_input: Optional[tuple] = None  # (source, value)
 
+        # Command dispatch table; anything else falls through to _handle_command
+        self._cmd_handlers = {
+            "register": self._handle_register,
+            "unregister": lambda cmd_data: self.clear_hotkey(cmd_data.get("slot")),
+            "help": lambda _: self._handle_help(),
+        }
+
     def _on_mqtt_connect(self, client, userdata, flags, rc):
         """Callback when MQTT client connects."""
         if rc == 0:
@@ -117,12 +216,12 @@ class Listener:
     def _on_mqtt_message(self, client, userdata, message):
         """Handle incoming MQTT messages on LISTENER topic."""
         try:
-            payload = message.payload.decode()
-            logger.debug(f"Listener received message: {payload}")
+            payload = message.payload
+            logger.opt(lazy=True).debug("Listener received message: {}", lambda: payload.decode(errors="replace"))
 
-            # Try to parse as JSON
+            # Try to parse as JSON (straight from the payload bytes)
             try:
-                cmd_data = json.loads(payload)
+                cmd_data = json_loads(payload)
 
                 # Handle event messages - check for restore flag
                 if "event" in cmd_data:
@@ -137,34 +236,11 @@ class Listener:
                     logger.debug(f"Ignoring event message: {event}")
                     return
 
-                # Handle cmd-based format
-                cmd = cmd_data.get("cmd")
-                
-                if cmd == "register":
-                    # Register hotkey
-                    slot = cmd_data.get("slot")
-                    source = cmd_data.get("input")
-                    suppress = cmd_data.get("suppress", False)
-
-                    try:
-                        self.register_hotkey(slot, source, gamepad_name=self._selected_gamepad, message=None, suppress=suppress)
-                    except Exception as e:
-                        logger.error(f"Error registering hotkey: {e}")
-
-                elif cmd == "unregister":
-                    # Unregister hotkey
-                    slot = cmd_data.get("slot")
-                    self.clear_hotkey(slot)
-
-                elif cmd == "help":
-                    # Handle help command
-                    self._handle_help()
-
-                else:
-                    # Handle other commands (get_gamepads, etc.)
-                    self._handle_command(cmd_data)
-            except json.JSONDecodeError:
-                logger.warning(f"Received non-JSON message: {payload}")
+                # Handle cmd-based format; other commands (get_gamepads, etc.) use _handle_command
+                handler = self._cmd_handlers.get(cmd_data.get("cmd"), self._handle_command)
+                handler(cmd_data)
+            except (JSONDecodeError, UnicodeDecodeError):
+                logger.warning(f"Received non-JSON message: {payload!r}")
         except Exception as e:
             logger.error(f"Error processing MQTT message: {e}")
 
@@ -215,6 +291,7 @@ class Listener:
                 return
 
             self._running = False
+        self._shutdown_event.set()
 
         # Stop keyboard listener
         if self._keyboard_listener:
@@ -233,6 +310,14 @@ class Listener:
 
         logger.info("Listener stopped all input listeners")
 
+    def request_shutdown(self):
+        """Wake wait_for_shutdown(); safe to call from a signal handler."""
+        self._shutdown_event.set()
+
+    def wait_for_shutdown(self):
+        """Block until request_shutdown() or stop() is called."""
+        self._shutdown_event.wait()
+
     def get_gamepads(self) -> List[Dict[str, Any]]:
         """Get a list of available gamepad devices."""
         # Refresh device list to detect newly connected gamepads
@@ -251,89 +336,24 @@ class Listener:
     def emit(self, topic: str, data: Dict[str, Any]):
         """Emit an event via MQTT."""
         if self._mqtt_connected:
-            message = json.dumps(data)
+            message = json_dumps(data)
             self._mqtt_client.publish(topic, message, qos=1)
 
+    def _handle_register(self, cmd_data: Dict[str, Any]):
+        """Handle the register command."""
+        slot = cmd_data.get("slot")
+        source = cmd_data.get("input")
+        suppress = cmd_data.get("suppress", False)
+
+        try:
+            self.register_hotkey(slot, source, gamepad_name=self._selected_gamepad, message=None, suppress=suppress)
+        except Exception as e:
+            logger.error(f"Error registering hotkey: {e}")
+
     def _handle_help(self):
         """Handle the help command."""
-        help_details = {
-            "description": "Global input listener supporting keyboard, mouse, and gamepad hotkeys",
-            "features": [
-                "8 hotkey slots (1-8)",
-                "Multiple input sources (keyboard, mouse, gamepad)",
-                "Auto-select first available gamepad",
-                "Custom message attachment",
-                "Event suppression (prevent OS from seeing event)"
-            ],
-            "commands": {
-                "register": {
-                    "description": "Register a hotkey for a specific slot",
-                    "parameters": {
-                        "cmd": "'register' (required)",
-                        "slot": "Hotkey slot number (1-8, required)",
-                        "input": "Input source: 'keyboard', 'mouse', or 'gamepad' (required)",
-                        "suppress": "Whether to suppress the event (boolean, required)"
-                    },
-                    "example": {
-                        "cmd": "register",
-                        "slot": 1,
-                        "input": "keyboard",
-                        "suppress": False
-                    }
-                },
-                "unregister": {
-                    "description": "Unregister/clear a hotkey slot",
-                    "parameters": {
-                        "cmd": "'unregister' (required)",
-                        "slot": "Hotkey slot number (1-8, required)"
-                    },
-                    "example": {
-                        "cmd": "unregister",
-                        "slot": 1
-                    }
-                },
-                "help": {
-                    "description": "Get help information about the listener",
-                    "parameters": {
-                        "cmd": "'help' (required)"
-                    },
-                    "example": {
-                        "cmd": "help"
-                    }
-                }
-            },
-            "events": {
-                "hotkey_triggered": {
-                    "description": "Emitted when a registered hotkey is triggered",
-                    "topic": "LISTENER",
-                    "fields": {
-                        "event": "'hotkey_triggered'",
-                        "slot": "Hotkey slot number (1-8)",
-                        "source": "Input source ('keyboard', 'mouse', or 'gamepad')",
-                        "value": "The key/button/code that was pressed",
-                        "gamepad_name": "Gamepad device name (if source is gamepad)",
-                        "message": "Custom message (if configured)"
-                    },
-                    "example": {
-                        "event": "hotkey_triggered",
-                        "slot": 1,
-                        "source": "keyboard",
-                        "value": "a",
-                        "message": "My custom action"
-                    }
-                }
-            },
-            "workflow": [
-                "1. Send registration to LISTENER topic: {\"cmd\": \"register\", \"slot\": 1, \"input\": \"keyboard\", \"suppress\": false}",
-                "2. Press the key/button/gamepad input you want to register",
-                "3. Listener will confirm registration via log",
-                "4. When you press that input again, a 'hotkey_triggered' event is emitted to LISTENER topic",
-                "5. To unregister: send {\"cmd\": \"unregister\", \"slot\": 1}",
-                "6. To get help: send {\"cmd\": \"help\"}"
-            ]
-        }
-        help_message = {"info": help_details}
-        self.emit("LISTENER", help_message)
+        if self._mqtt_connected:
+            self._mqtt_client.publish("LISTENER", _HELP_PAYLOAD_BYTES, qos=1)
         logger.info("Sent help message to LISTENER topic")
 
     def _handle_command(self, cmd_data: Dict[str, Any]):
@@ -834,12 +854,12 @@ def listener_process(host: str, port: int, enable_logging: bool = False):
     listener = Listener(mqtt_host=host, mqtt_port=port)
     listener.start()
 
+    # Ctrl+C and terminate() only wake the wait below; stop() runs in the finally block
+    signal.signal(signal.SIGINT, lambda *_: listener.request_shutdown())
+    signal.signal(signal.SIGTERM, lambda *_: listener.request_shutdown())
+
     try:
-        # Keep the process running
-        while True:
-            time.sleep(1)
-    except KeyboardInterrupt:
-        logger.info("Listener interrupted")
+        listener.wait_for_shutdown()
     finally:
         listener.stop()
         logger.info("Listener stopped")
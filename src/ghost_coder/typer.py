@@ -3,10 +3,14 @@ Typer process for automated text input simulation.
 Listens for commands on MQTT TYPER topic and monitors STATE for configuration.
 """
 
+import sys
+import socket
 import time
 import json
 import threading
 import random
+import queue
+from itertools import islice
 from ghost_coder.data import SingleKey, MultiKeys, TimedPause, MouseScroll, RepeatedKey, TextData
 from pynput.keyboard import Key
 from pynput.keyboard import Controller as KbController
@@ -14,7 +18,66 @@ from pynput.mouse import Controller as MsController
 import pygetwindow as gw
 import paho.mqtt.client as Client
 from loguru import logger
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Union
+import ctypes
+
+try:
+    # orjson parses bytes directly and is several times faster than json. It is a
+    # declared dependency everywhere but 32-bit x86, which has no orjson wheels
+    from orjson import loads as json_loads, dumps as json_dumps, JSONDecodeError
+except ImportError:
+    from json import loads as json_loads, JSONDecodeError
+
+    def json_dumps(obj: Any) -> bytes:
+        return json.dumps(obj).encode()
+
+if sys.platform == "win32":
+    from ctypes import wintypes
+
+    # A private user32 handle: ctypes.windll.user32 hands every module the same
+    # function objects (pynput, pygetwindow), so prototypes set there would leak to them
+    _user32 = ctypes.WinDLL("user32", use_last_error=True)
+
+    # Foreground window calls made directly rather than through pygetwindow's wrappers
+    _GetForegroundWindow = _user32.GetForegroundWindow
+    _GetForegroundWindow.argtypes = []
+    _GetForegroundWindow.restype = wintypes.HWND
+    _SetForegroundWindow = _user32.SetForegroundWindow
+    _SetForegroundWindow.argtypes = [wintypes.HWND]
+    _SetForegroundWindow.restype = wintypes.BOOL
+else:
+    _GetForegroundWindow = None
+    _SetForegroundWindow = None
+
+# Key names used by TextData tokens mapped to pynput keys, built once at import
+KEY_MAP = {name: Key[name] for name in Key.__members__}
+
+# How long (seconds) a foreground window lookup is reused before asking the OS again
+FOCUS_CACHE_TTL = 0.05
+
+# Minimum time (seconds) between activate() calls on the target window
+FOCUS_ACTIVATE_INTERVAL = 0.5
+
+# Seconds after start() before STATE is requested again if no push has arrived
+STATE_SEED_TIMEOUT = 5.0
+
+# GIL switch interval (seconds) for the typer process, see typer_process
+TYPER_SWITCH_INTERVAL = 0.001
+
+# play_status updates only ever carry one of these values, so serialize them once
+STATUS_MESSAGES = {
+    status: json_dumps({"cmd": "update_state", "key": "play_status", "value": status})
+    for status in ("playing", "paused", "stopped")
+}
+
+# Fixed command acknowledgements and notices, serialized once at import
+ACK_MESSAGES = {
+    "paused": json_dumps({"result": "ok", "message": "Playback paused"}),
+    "playing": json_dumps({"result": "ok", "message": "Playback playing"}),
+    "advance_newline": json_dumps({"result": "ok", "message": "Advancing to next newline"}),
+    "advance_token": json_dumps({"result": "ok", "message": "Advancing by one token"}),
+}
+PLAYBACK_DELAY_NOTICE = json_dumps({"cmd": "notify", "message": "Playback will start in 5 seconds"})
 
 
 class Typer:
@@ -30,6 +93,24 @@ class Typer:
     - State synchronization via STATE topic
     """
 
+    # Commands answered on the MQTT thread; the rest can touch files, windows
+    # or sleep, so they run on the command worker in arrival order
+    _INLINE_COMMANDS = frozenset({"data"})
+
+    # Configuration attributes mirrored from STATE values of the same name
+    _STATE_KEYS = (
+        "play_status",
+        "speed",
+        "pause_on_new_line",
+        "pause_on_window_not_focused",
+        "refocus_window_on_resume",
+        "start_playback_paused",
+        "auto_home_on_newline",
+        "control_on_newline",
+        "replace_quad_spaces_with_tab",
+        "varied_coding_speed",
+    )
+
     def __init__(self, mqtt_host, mqtt_port: int):
         """
         Initialize the Typer.
@@ -38,21 +119,24 @@ class Typer:
             mqtt_port: Port for MQTT broker connection
         """
         # Text data
-        self.text_tokens = None
-        self.text_tokens_preview = []
-        self.original_text_tokens = None  # Store original for reset
+        self.text_tokens = None  # Immutable tuple; playback only moves _token_cursor
+        self._token_cursor = 0  # Index of the next token to type; the preview shares it
         self.current_file_path = None  # Store file path for reload
 
         # Playback state
+        self._resume_event = threading.Event()  # Set whenever playback is not paused
+        self._advance_event = threading.Event()  # Set on advance/stop to wake retry back-offs
         self.play = False
         self.paused = False
         self.advance_to_newline = 0
         self.advance_token = 0
         self.play_in_session = False
         self.resumed = 0
+        self._next_deadline = 0.0  # Monotonic time the current keystroke should end
 
         # Configuration (will be synced from STATE)
         self.play_status = "stopped"
+        self._last_published_status = None
         self.speed = 50
         self.pause_on_new_line = True
         self.pause_on_window_not_focused = True
@@ -65,6 +149,12 @@ class Typer:
 
         # Window handle
         self.hwnd = None
+        self._target_window = None  # pygetwindow Window for self.hwnd
+
+        # Short-lived cache of the foreground window handle
+        self._focus_cache_hwnd = None
+        self._focus_cache_ts = 0.0
+        self._last_focus_time = 0.0  # Monotonic time of the last activate() call
 
         # Input controllers
         self.kb = KbController()
@@ -75,17 +165,75 @@ class Typer:
         self._mqtt_host = mqtt_host
         self._mqtt_client = Client.Client(Client.CallbackAPIVersion.VERSION1, "typer_client")
         self._mqtt_client.on_connect = self._on_mqtt_connect
-        self._mqtt_client.on_message = self._on_mqtt_message
+        # paho routes each subscribed topic straight to its own handler
+        self._mqtt_client.message_callback_add("APP", self._on_app_message)
+        self._mqtt_client.message_callback_add("STATE", self._on_state_message)
+        self._mqtt_client.message_callback_add("TYPER", self._on_typer_message)
+        self._mqtt_client.on_socket_open = self._on_mqtt_socket_open
         self._mqtt_connected = False
         self._running = False
 
-        # State sync thread
-        self._state_sync_thread: Optional[threading.Thread] = None
+        # STATE values pushed by the UI; set once the first push arrives
         self._state_values = {}
+        self._state_ready = threading.Event()
 
         # Playback thread
         self._playback_thread: Optional[threading.Thread] = None
 
+        # Command worker, keeps slow handlers off the paho network thread
+        self._cmd_queue: queue.Queue = queue.Queue()
+        self._cmd_thread: Optional[threading.Thread] = None
+
+        # Re-requests STATE if the first push never arrives
+        self._seed_timer: Optional[threading.Timer] = None
+
+        # type_token dispatch table, keyed on the exact token class
+        self._token_handlers = {
+            MultiKeys: self._type_multi_keys,
+            SingleKey: self._type_single_key,
+            TimedPause: self._type_timed_pause,
+            MouseScroll: self._type_mouse_scroll,
+            RepeatedKey: self._type_repeated_key,
+        }
+
+        # TYPER command dispatch table
+        self._cmd_handlers = {
+            "load_file": self._handle_load_file,
+            "data": lambda _: self._handle_data(),
+            "play": lambda _: self._handle_play(),
+            "stop": lambda _: self._handle_stop(),
+            "pause": lambda _: self._handle_pause(),
+            "advance_newline": lambda _: self._handle_advance_newline(),
+            "advance_token": lambda _: self._handle_advance_token(),
+        }
+
+    @property
+    def paused(self) -> bool:
+        """Whether playback is paused."""
+        return self._paused
+
+    @paused.setter
+    def paused(self, value: bool):
+        # Keep the resume event in step so paused playback loops can block on it
+        self._paused = value
+        if value:
+            self._resume_event.clear()
+        else:
+            self._resume_event.set()
+
+    @property
+    def speed(self) -> int:
+        """Base per-keystroke delay in milliseconds."""
+        return self._speed
+
+    @speed.setter
+    def speed(self, value: int):
+        # Speed only changes on STATE updates, so derive the sleep durations here
+        # rather than on every keystroke
+        self._speed = value
+        self._sleep_full = value * 0.001
+        self._sleep_half = self._sleep_full * 0.5
+
     def _on_mqtt_connect(self, client, userdata, flags, rc):
         """Callback when MQTT client connects."""
         if rc == 0:
@@ -95,65 +243,76 @@ class Typer:
             client.subscribe("APP", qos=1)
             logger.info("Typer subscribed to TYPER, STATE, and APP topics")
             self._mqtt_connected = True
+            # Ask once for the current state; later changes are pushed to us
+            self._request_state()
         else:
             logger.error(f"Typer failed to connect to MQTT broker, return code: {rc}")
 
-    def _on_mqtt_message(self, client, userdata, message):
-        """Handle incoming MQTT messages."""
+    def _on_mqtt_socket_open(self, client, userdata, sock):
+        """Disable Nagle's algorithm so small publishes go out immediately."""
         try:
-            payload = message.payload.decode()
-            logger.debug(f"Typer received message on {message.topic}: {payload}")
-
-            # Handle CLOSE command on APP topic
-            if message.topic == "APP":
-                try:
-                    cmd_data = json.loads(payload)
-                    if cmd_data.get("cmd") == "CLOSE" or cmd_data.get("command") == "CLOSE":
-                        logger.info("Typer received CLOSE command")
-                        self.stop()
-                        return
-                except json.JSONDecodeError:
-                    pass
-                return
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except (AttributeError, OSError) as e:
+            logger.debug(f"Could not set TCP_NODELAY on MQTT socket: {e}")
+
+    def _parse_payload(self, message, warn: bool = False):
+        """Parse an MQTT message's raw bytes, returning None if they aren't JSON."""
+        payload = message.payload
+        logger.opt(lazy=True).debug(
+            "Typer received message on {}: {}",
+            lambda: message.topic,
+            lambda: payload.decode(errors="replace"),
+        )
+        try:
+            return json_loads(payload)
+        except (JSONDecodeError, UnicodeDecodeError):
+            if warn:
+                logger.warning(f"Received non-JSON message: {payload.decode(errors='replace')}")
+            return None
+
+    def _on_app_message(self, client, userdata, message):
+        """Handle the CLOSE command on the APP topic."""
+        cmd_data = self._parse_payload(message)
+        if cmd_data is None:
+            return
+        try:
+            if cmd_data.get("cmd") == "CLOSE" or cmd_data.get("command") == "CLOSE":
+                logger.info("Typer received CLOSE command")
+                self.stop()
+        except Exception as e:
+            logger.error(f"Error processing MQTT message: {e}")
 
-            # Handle STATE topic messages (state updates)
-            if message.topic == "STATE":
-                try:
-                    state_data = json.loads(payload)
-                    if "state-data" in state_data and isinstance(state_data["state-data"], dict):
-                        logger.info("Typer received new STATE Data")
-                        self._state_values.update(state_data["state-data"])
-
-                        self._sync_from_state()
-                        logger.info("Typer state synced")
-                except json.JSONDecodeError:
-                    pass
-                return
+    def _on_state_message(self, client, userdata, message):
+        """Handle state updates on the STATE topic."""
+        cmd_data = self._parse_payload(message)
+        if cmd_data is None:
+            return
+        try:
+            if "state-data" in cmd_data and isinstance(cmd_data["state-data"], dict):
+                logger.info("Typer received new STATE Data")
+                self._state_values.update(cmd_data["state-data"])
 
-            # Handle TYPER topic commands
-            try:
-                cmd_data = json.loads(payload)
-                cmd = cmd_data.get("cmd")
-
-                if cmd == "load_file":
-                    self._handle_load_file(cmd_data)
-                elif cmd == "data":
-                    self._handle_data()
-                elif cmd == "play":
-                    self._handle_play()
-                elif cmd == "stop":
-                    self._handle_stop()
-                elif cmd == "pause":
-                    self._handle_pause()
-                elif cmd == "advance_newline":
-                    self._handle_advance_newline()
-                elif cmd == "advance_token":
-                    self._handle_advance_token()
-                else:
-                    logger.warning(f"Unknown command: {cmd}")
+                self._sync_from_state()
+                self._state_ready.set()
+                logger.info("Typer state synced")
+        except Exception as e:
+            logger.error(f"Error processing MQTT message: {e}")
+
+    def _on_typer_message(self, client, userdata, message):
+        """Handle commands on the TYPER topic."""
+        cmd_data = self._parse_payload(message, warn=True)
+        if cmd_data is None:
+            return
+        try:
+            cmd = cmd_data.get("cmd")
 
-            except json.JSONDecodeError:
-                logger.warning(f"Received non-JSON message: {payload}")
+            handler = self._cmd_handlers.get(cmd)
+            if handler is None:
+                logger.warning(f"Unknown command: {cmd}")
+            elif cmd in self._INLINE_COMMANDS:
+                handler(cmd_data)
+            else:
+                self._cmd_queue.put((cmd, handler, cmd_data))
         except Exception as e:
             logger.error(f"Error processing MQTT message: {e}")
 
@@ -163,29 +322,31 @@ class Typer:
 
         if not file_path:
             error_msg = {"error": "Missing 'file' parameter"}
-            self.publish("UI", error_msg)
+            self.publish("UI", error_msg, qos=1)
             logger.error("load_file command missing 'file' parameter")
             return
 
         try:
             self.initialize_text_data(file_path)
             result = {"result": "ok", "message": f"Loaded file: {file_path}"}
-            self.publish("TYPER", result)
+            self.publish("TYPER", result, qos=1)
             logger.info(f"Successfully loaded file: {file_path}")
         except Exception as e:
             error_msg = {"error": f"Failed to load file: {str(e)}"}
-            self.publish("UI", error_msg)
+            self.publish("UI", error_msg, qos=1)
             logger.error(f"Error loading file {file_path}: {e}")
 
     def _handle_data(self):
         """Handle data command - return text tokens preview."""
-        if self.text_tokens_preview:
-            result = {"result": self.text_tokens_preview}
+        # Formatted on request from the remaining tokens; nothing is kept between requests
+        preview = [f"[ {x} ]" for x in islice(self.text_tokens or (), self._token_cursor, None)]
+        if preview:
+            result = {"result": preview}
         else:
             result = {"result": [], "warning": "No data loaded"}
 
         self.publish("TYPER", result)
-        logger.debug(f"Sent data with {len(self.text_tokens_preview)} tokens")
+        logger.debug(f"Sent data with {len(preview)} tokens")
 
     def _handle_play(self):
         """Handle play command - start typing."""
@@ -205,15 +366,13 @@ class Typer:
             self.play = True
             self.paused = False
 
-            # Update play_status state to playing
-            self._update_play_status("playing")
-
             # Start playback in a separate thread
             self._playback_thread = threading.Thread(target=self._play_with_delay, daemon=True)
             self._playback_thread.start()
 
-            notify = {"cmd": "notify", "message": "Playback will start in 5 seconds"}
-            self.publish("UI", notify)
+            # Update play_status state to playing and notify the UI
+            self._update_play_status("playing")
+            self.publish("UI", PLAYBACK_DELAY_NOTICE)
             logger.info("Playback will start in 5 seconds")
 
     def _handle_stop(self):
@@ -222,6 +381,7 @@ class Typer:
         self.paused = False
         self.play_in_session = False
         self.resumed = 0
+        self._advance_event.set()
 
         # Reset to beginning of file
         self._reset_to_beginning()
@@ -234,6 +394,8 @@ class Typer:
     def _handle_pause(self):
         """Handle pause command."""
         self.paused = not self.paused
+        self._focus_cache_ts = 0.0
+        self._last_focus_time = 0.0
         state = "paused" if self.paused else "playing"
 
         # If resuming (unpausing) and refocus is enabled, focus the window first and wait
@@ -243,31 +405,37 @@ class Typer:
             time.sleep(2)
             logger.info("Resuming playback now")
 
-        # Update play_status state
+        # Update play_status state and acknowledge
         self._update_play_status(state)
-
-        result = {"result": "ok", "message": f"Playback {state}"}
-        self.publish("TYPER", result)
+        self.publish("TYPER", ACK_MESSAGES[state])
         logger.info(f"Playback {state}")
 
     def _handle_advance_newline(self):
         """Handle advance_newline command - advance to next newline."""
         self.advance_to_newline += 1
-        result = {"result": "ok", "message": "Advancing to next newline"}
-        self.publish("TYPER", result)
+        self._resume_event.set()
+        self._advance_event.set()
+        self.publish("TYPER", ACK_MESSAGES["advance_newline"])
         logger.info("Advance to newline triggered")
 
     def _handle_advance_token(self):
         """Handle advance_token command - advance by one token."""
         self.advance_token += 1
-        result = {"result": "ok", "message": "Advancing by one token"}
-        self.publish("TYPER", result)
+        self._resume_event.set()
+        self._advance_event.set()
+        self.publish("TYPER", ACK_MESSAGES["advance_token"])
         logger.info("Advance token triggered")
 
     def _sync_from_state(self):
         """Sync configuration from STATE values."""
-        if "play_status" in self._state_values:
-            self.play_status = self._state_values["play_status"]
+        state_values = self._state_values
+        for key in self._STATE_KEYS:
+            if key in state_values and getattr(self, key) != state_values[key]:
+                setattr(self, key, state_values[key])
+
+        # play_status drives local playback flags on every sync, as STATE is authoritative
+        if "play_status" in state_values:
+            self._last_published_status = self.play_status
             if self.play_status == "playing":
                 self.play = True
                 self.paused = False
@@ -277,24 +445,6 @@ class Typer:
             else:
                 self.play = False
                 self.paused = False
-        if "speed" in self._state_values:
-            self.speed = self._state_values["speed"]
-        if "pause_on_new_line" in self._state_values:
-            self.pause_on_new_line = self._state_values["pause_on_new_line"]
-        if "pause_on_window_not_focused" in self._state_values:
-            self.pause_on_window_not_focused = self._state_values["pause_on_window_not_focused"]
-        if "refocus_window_on_resume" in self._state_values:
-            self.refocus_window_on_resume = self._state_values["refocus_window_on_resume"]
-        if "start_playback_paused" in self._state_values:
-            self.start_playback_paused = self._state_values["start_playback_paused"]
-        if "auto_home_on_newline" in self._state_values:
-            self.auto_home_on_newline = self._state_values["auto_home_on_newline"]
-        if "control_on_newline" in self._state_values:
-            self.control_on_newline = self._state_values["control_on_newline"]
-        if "replace_quad_spaces_with_tab" in self._state_values:
-            self.replace_quad_spaces_with_tab = self._state_values["replace_quad_spaces_with_tab"]
-        if "varied_coding_speed" in self._state_values:
-            self.varied_coding_speed = self._state_values["varied_coding_speed"]
 
     def _update_window_handle(self):
         """Update the window handle based on window_title."""
@@ -303,6 +453,7 @@ class Typer:
                 windows = gw.getWindowsWithTitle(self.window_title)
                 if windows:
                     self.hwnd = windows[0]._hWnd
+                    self._target_window = windows[0]
                     logger.info(f"Updated window handle for: {self.window_title}")
             except Exception as e:
                 logger.error(f"Error getting window handle: {e}")
@@ -312,11 +463,40 @@ class Typer:
         """Load and parse a text file into tokens."""
         with open(file_path, 'r', encoding='utf-8') as f:
             file_data = f.read()
-            text_data = TextData(file_data, replace_quad_spaces_with_tab=self.replace_quad_spaces_with_tab)
-            self.text_tokens = text_data.text_tokens
-            self.original_text_tokens = text_data.text_tokens.copy()  # Save original
-            self.text_tokens_preview = ['[ ' + str(x) + ' ]' for x in text_data.text_tokens]
-            self.current_file_path = file_path  # Save file path
+        text_data = TextData(file_data, replace_quad_spaces_with_tab=self.replace_quad_spaces_with_tab)
+        self._resolve_keys(text_data.text_tokens)
+        # Tokens are never mutated during playback, so the one tuple is also what reset rewinds to
+        self.text_tokens = self._coalesce_tokens(text_data.text_tokens)
+        self._token_cursor = 0
+        self.current_file_path = file_path  # Save file path
+
+    @staticmethod
+    def _coalesce_tokens(tokens) -> tuple:
+        """Merge adjacent plain-text tokens into a single run.
+
+        TextData already yields text between commands as one string, but
+        unrecognized <<...>> markers fall back to plain text next to it.
+        Merging those lets the playback loop handle each run in one pass.
+        """
+        coalesced = []
+        for token in tokens:
+            if isinstance(token, str) and coalesced and isinstance(coalesced[-1], str):
+                coalesced[-1] += token
+            else:
+                coalesced.append(token)
+        return tuple(coalesced)
+
+    @staticmethod
+    def _resolve_keys(tokens):
+        """Resolve key names on key tokens to pynput keys once, at load time.
+
+        Names that are not special keys (regular characters) are kept as-is.
+        """
+        for token in tokens:
+            if isinstance(token, MultiKeys):
+                token.resolved_keys = tuple(KEY_MAP.get(key, key) for key in token.keys)
+            elif isinstance(token, (SingleKey, RepeatedKey)):
+                token.resolved_key = KEY_MAP.get(token.key, token.key)
 
     def get_typing_speed(self):
         """Get the typing speed with optional random variation.
@@ -330,105 +510,178 @@ class Typer:
             return varied_speed
         return self.speed
 
-    def type_token(self, token):
-        """Type a single token."""
-        kb = self.kb
-        ms = self.ms
+    def type_token(self, token, already_focused: bool = False):
+        """Type a single token.
+
+        Args:
+            token: Token to type
+            already_focused: Caller just confirmed the target window has focus,
+                so the first focus check can be skipped
+        """
         token_completed = False
         # Get typing speed once per token for consistent timing within the token
-        typing_speed = self.get_typing_speed()
+        if self.varied_coding_speed:
+            delay = self.get_typing_speed() * 0.001
+            half_delay = delay * 0.5
+        else:
+            delay = self._sleep_full
+            half_delay = self._sleep_half
+        # Plain text is the only token type that isn't a key in the table
+        type_fn = self._token_handlers.get(type(token), self._type_text)
 
         while not token_completed and self.play:
-            if isinstance(token, MultiKeys):
-                if self.check_window_focused(pause_if_not=True):
-                    # Press all keys in order
-                    for key in token.keys:
-                        self.focus_window()
-                        if hasattr(Key, key):
-                            kb.press(getattr(Key, key))
-                        else:
-                            kb.press(key)
-                    time.sleep(typing_speed/1000/2)
-                    # Release all keys in reverse order (for proper modifier key handling)
-                    for key in reversed(token.keys):
-                        self.focus_window()
-                        if hasattr(Key, key):
-                            kb.release(getattr(Key, key))
-                        else:
-                            kb.release(key)
-                    token_completed = True
-            elif isinstance(token, SingleKey):
-                if self.check_window_focused(pause_if_not=True):
-                    if token.key == "enter" and self.control_on_newline:
-                        kb.press(Key.ctrl)
-                        kb.press(getattr(Key, token.key))
-                        time.sleep(typing_speed/1000)
-                        kb.release(getattr(Key, token.key))
-                        kb.release(Key.ctrl)
-                    elif token.key == "atpause":
-                        # <<PAUSE>> should always pause and consume advance_to_newline
-                        if self.advance_to_newline > 0:
-                            self.advance_to_newline -= 1
-                        self.paused = True
-                        self._update_play_status("paused")
-                    else:
-                        kb.press(getattr(Key, token.key))
-                        time.sleep(typing_speed/1000)
-                        kb.release(getattr(Key, token.key))
-
-                    if token.key == "enter" and self.auto_home_on_newline:
-                        kb.press(Key.home)
-                        time.sleep(typing_speed/1000)
-                        kb.release(Key.home)
-
-                    if (token.key == "enter" and self.pause_on_new_line) or (token.key == "enter" and self.advance_to_newline > 0):
-                        if self.advance_to_newline > 0:
-                            self.advance_to_newline -= 1
-                        self.paused = True
-                        self._update_play_status("paused")
-                    token_completed = True
-
-            elif isinstance(token, TimedPause):
-                if self.check_window_focused(pause_if_not=True):
-                    time.sleep(token.time)
-                    token_completed = True
-            elif isinstance(token, MouseScroll):
-                if self.check_window_focused(pause_if_not=True):
-                    for _ in range(token.scroll_count):
-                        ms.scroll(0, token.scroll_direction)
-                        time.sleep(typing_speed/1000/2)
-                    token_completed = True
-            elif isinstance(token, RepeatedKey):
-                if self.check_window_focused(pause_if_not=True):
-                    self.focus_window()
-                    for _ in range(token.count):
-                        kb.press(getattr(Key, token.key))
-                        time.sleep(typing_speed/1000)
-                        kb.release(getattr(Key, token.key))
-                        time.sleep(typing_speed/1000/4)  # Small delay between repeated presses
-                    token_completed = True
-            else:
-                for char in token:
-                    char_completed = False
-                    while not char_completed:
-                        if (
-                            (self.play and self.resumed > 0) or
-                            (self.check_window_focused(pause_if_not=True) and not self.paused) or
-                            (self.play and self.paused and self.advance_to_newline > 0) or
-                            (self.play and self.paused and self.advance_token > 0)
-                        ):
-                            self.focus_window()
-                            if self.resumed:
-                                self.resumed = 0
-                            kb.press(char)
-                            time.sleep(typing_speed/1000)
-                            kb.release(char)
-                            char_completed = True
-                        time.sleep(0.01)
-                token_completed = True
+            focused = already_focused or self.check_window_focused(pause_if_not=True)
+            already_focused = False
+            token_completed = type_fn(token, focused, delay, half_delay)
+            if not token_completed:
+                self._wait_for_resume()
         time.sleep(0.01)
         return token_completed
 
+    def _type_multi_keys(self, token: MultiKeys, focused: bool, delay: float, half_delay: float) -> bool:
+        """Press a key chord; returns whether the token was typed."""
+        if not focused:
+            return False
+        keys = token.resolved_keys
+        self._ensure_focused()
+        # Press all keys in order
+        for key in keys:
+            self.kb.press(key)
+        time.sleep(half_delay)
+        # Release all keys in reverse order (for proper modifier key handling)
+        for key in reversed(keys):
+            self.kb.release(key)
+        return True
+
+    def _type_single_key(self, token: SingleKey, focused: bool, delay: float, half_delay: float) -> bool:
+        """Press a single key, applying the newline and <<PAUSE>> behaviors."""
+        if not focused:
+            return False
+        press = self.kb.press
+        release = self.kb.release
+        is_enter = token.key == "enter"
+        if is_enter and self.control_on_newline:
+            press(Key.ctrl)
+            press(Key.enter)
+            time.sleep(delay)
+            release(Key.enter)
+            release(Key.ctrl)
+        elif token.key == "atpause":
+            # <<PAUSE>> should always pause and consume advance_to_newline
+            if self.advance_to_newline > 0:
+                self.advance_to_newline -= 1
+            self.paused = True
+            self._update_play_status("paused")
+        else:
+            key = token.resolved_key
+            press(key)
+            time.sleep(delay)
+            release(key)
+
+        if is_enter and self.auto_home_on_newline:
+            press(Key.home)
+            time.sleep(delay)
+            release(Key.home)
+
+        if is_enter and (self.pause_on_new_line or self.advance_to_newline > 0):
+            if self.advance_to_newline > 0:
+                self.advance_to_newline -= 1
+            self.paused = True
+            self._update_play_status("paused")
+        return True
+
+    def _type_timed_pause(self, token: TimedPause, focused: bool, delay: float, half_delay: float) -> bool:
+        """Wait out a <<PAUSE=N>> token."""
+        if not focused:
+            return False
+        time.sleep(token.time)
+        return True
+
+    def _type_mouse_scroll(self, token: MouseScroll, focused: bool, delay: float, half_delay: float) -> bool:
+        """Scroll the mouse wheel."""
+        if not focused:
+            return False
+        for _ in range(token.scroll_count):
+            self.ms.scroll(0, token.scroll_direction)
+            time.sleep(half_delay)
+        return True
+
+    def _type_repeated_key(self, token: RepeatedKey, focused: bool, delay: float, half_delay: float) -> bool:
+        """Press one key token.count times."""
+        if not focused:
+            return False
+        self._ensure_focused()
+        press = self.kb.press
+        release = self.kb.release
+        key = token.resolved_key
+        for _ in range(token.count):
+            press(key)
+            self._pace_keystroke(delay)
+            release(key)
+            time.sleep(half_delay * 0.5)  # Small delay between repeated presses
+        return True
+
+    def _type_text(self, token: str, focused: bool, delay: float, half_delay: float) -> bool:
+        """Type a plain text token, gating each character on focus and pause state."""
+        # Bind everything the per-character loop calls, so each keystroke costs
+        # local lookups rather than attribute loads
+        press = self.kb.press
+        release = self.kb.release
+        pace = self._pace_keystroke
+        ensure_focused = self._ensure_focused
+        check_focused = self.check_window_focused
+        for char in token:
+            char_completed = False
+            while not char_completed:
+                if (
+                    (self.play and self.resumed > 0) or
+                    (check_focused(pause_if_not=True) and not self.paused) or
+                    (self.play and self.paused and self.advance_to_newline > 0) or
+                    (self.play and self.paused and self.advance_token > 0)
+                ):
+                    ensure_focused()
+                    if self.resumed:
+                        self.resumed = 0
+                    press(char)
+                    pace(delay)
+                    release(char)
+                    char_completed = True
+                else:
+                    self._wait_for_resume()
+        return True
+
+    def _wait_for_resume(self):
+        """Wait for playback to be able to continue.
+
+        While paused with nothing to advance, blocks until resumed, advanced or
+        stopped (with a timeout as a safety net). Otherwise backs off briefly so
+        retry loops don't spin, waking early on an advance or stop.
+        """
+        if self.paused and not (self.advance_to_newline or self.advance_token or self.resumed):
+            self._resume_event.wait(timeout=1.0)
+            if self.paused:
+                # Woken by an advance; flags are re-checked by the caller
+                self._resume_event.clear()
+        else:
+            self._advance_event.wait(timeout=0.05)
+            self._advance_event.clear()
+
+    def _pace_keystroke(self, delay: float):
+        """Sleep until the next keystroke deadline.
+
+        Deadlines advance from the previous one rather than from now, so time
+        spent in pynput/focus calls is absorbed instead of slowing typing down.
+        If playback fell well behind (pause, focus loss) the schedule is
+        re-anchored rather than catching up in a burst.
+        """
+        now = time.monotonic()
+        if now - self._next_deadline > delay:
+            self._next_deadline = now
+        self._next_deadline += delay
+        remaining = self._next_deadline - now
+        if remaining > 0:
+            time.sleep(remaining)
+
     def _play_with_delay(self):
         """Wait 5 seconds then start typing."""
         logger.info("Waiting 5 seconds before starting playback...")
@@ -442,11 +695,8 @@ class Typer:
             self.play_status = "stopped"
             logger.error("Focus window is Ghost Coder... no new window was given focus, please")
 
-            state_msg = {"cmd": "update_state", "key": "play_status", "value": self.play_status}
-            self.publish("STATE", state_msg)
-            logger.debug(f"Updated play_status to '{self.play_status}'")
-
             notify = {"notify": "Focus window is Ghost Coder... no new window was given focus."}
+            self._update_play_status(self.play_status)
             self.publish("UI", notify)
             
             
@@ -455,18 +705,23 @@ class Typer:
 
     def _capture_active_window(self):
         """Capture the currently active window as the target."""
+        self._focus_cache_ts = 0.0
+        self._last_focus_time = 0.0
         try:
             active_window = gw.getActiveWindow()
             if active_window:
                 self.hwnd = active_window._hWnd
+                self._target_window = active_window
                 self.window_title = active_window.title
                 logger.info(f"Captured active window: '{self.window_title}' (hwnd: {self.hwnd})")
             else:
                 logger.warning("No active window found to capture")
                 self.hwnd = None
+                self._target_window = None
         except Exception as e:
             logger.error(f"Error capturing active window: {e}")
             self.hwnd = None
+            self._target_window = None
 
     def type_text_tokens(self):
         """Type all loaded text tokens."""
@@ -476,7 +731,12 @@ class Typer:
             self.paused = True
             self._update_play_status("paused")
 
-        for token in self.text_tokens:
+        # Each session types the file from the top
+        self._token_cursor = 0
+        tokens = self.text_tokens
+        token_count = len(tokens)  # The token tuple is fixed for the whole session
+        while self._token_cursor < token_count:
+            token = tokens[self._token_cursor]
             token_completed = False
             while not token_completed and self.play is True:
                 if (
@@ -484,29 +744,32 @@ class Typer:
                     (self.play and self.paused and self.advance_to_newline > 0) or
                     (self.play and self.paused and self.advance_token > 0)
                 ):
-                    if (
-                        (self.play and self.resumed > 0) or
-                        (not self.paused and self.check_window_focused(pause_if_not=True)) or
-                        (self.play and self.paused and self.advance_to_newline > 0) or
-                        (self.play and self.paused and self.advance_token > 0)
-                        
-                    ):
+                    # Check focus once here and hand the result to type_token
+                    focused = False
+                    if self.play and self.resumed > 0:
+                        ready = True
+                    elif not self.paused:
+                        focused = self.check_window_focused(pause_if_not=True)
+                        ready = focused
+                    else:
+                        ready = self.play and (self.advance_to_newline > 0 or self.advance_token > 0)
+
+                    if ready:
                         self.focus_window()
                         if self.resumed:
                             self.resumed = 0
-                        token_completed = self.type_token(token)
+                        token_completed = self.type_token(token, already_focused=focused)
                         if token_completed and self.advance_token > 0:
                             self.advance_token -= 1
                 if not self.play:
                     break
-                if self.paused:
-                    time.sleep(0.1)
+                if self.paused and not token_completed:
+                    self._wait_for_resume()
             if not self.play:
                 break
             if token_completed:
-                # Update preview (remove first token)
-                if self.text_tokens_preview:
-                    self.text_tokens_preview.pop(0)
+                # Advance past the typed token
+                self._token_cursor += 1
 
         # Playback finished
         self.play = False
@@ -526,11 +789,23 @@ class Typer:
         if not self.hwnd or not self.pause_on_window_not_focused:
             return True
 
-        active_window = gw.getActiveWindow()
-        if not active_window or active_window._hWnd != self.hwnd:
+        now = time.monotonic()
+        if now - self._focus_cache_ts < FOCUS_CACHE_TTL:
+            active_hwnd = self._focus_cache_hwnd
+        else:
+            if _GetForegroundWindow is not None:
+                active_hwnd = _GetForegroundWindow()
+            else:
+                active_window = gw.getActiveWindow()
+                active_hwnd = active_window._hWnd if active_window else None
+            self._focus_cache_hwnd = active_hwnd
+            self._focus_cache_ts = now
+
+        if active_hwnd != self.hwnd:
             if pause_if_not and not self.paused and not self.play_status == "stopped":
-                # Update local state first
+                # Update local state first; drop the cached lookup so resuming re-checks the OS
                 self.paused = True
+                self._focus_cache_ts = 0.0
 
                 # Publish play_status update to STATE process
                 self._update_play_status("paused")
@@ -540,37 +815,84 @@ class Typer:
 
     def focus_window(self):
         """Focus the target window."""
-        if self.hwnd:
-            try:
+        if not self.hwnd:
+            return
+        # Nothing to do if the window was seen in the foreground moments ago
+        now = time.monotonic()
+        if self._focus_cache_hwnd == self.hwnd and now - self._focus_cache_ts < FOCUS_CACHE_TTL:
+            return
+        # The OS keeps the window in front after activation, so don't re-activate it per token
+        if now - self._last_focus_time < FOCUS_ACTIVATE_INTERVAL:
+            return
+        try:
+            if _SetForegroundWindow is not None:
+                if _SetForegroundWindow(self.hwnd):
+                    self._last_focus_time = now
+                else:
+                    logger.debug(f"SetForegroundWindow failed for hwnd {self.hwnd}")
+                return
+            window = self._target_window
+            if window is None or window._hWnd != self.hwnd:
                 windows = [w for w in gw.getAllWindows() if w._hWnd == self.hwnd]
-                if windows:
-                    windows[0].activate()
-            except Exception as e:
-                logger.debug(f"Error focusing window: {e}")
+                window = windows[0] if windows else None
+                self._target_window = window
+            if window:
+                window.activate()
+                self._last_focus_time = now
+        except Exception as e:
+            logger.debug(f"Error focusing window: {e}")
+
+    def _ensure_focused(self):
+        """Refocus the target window unless the last focus check saw it in front."""
+        if self._focus_cache_hwnd == self.hwnd:
+            return
+        # Only a fresh lookup that saw another window skips the activate() rate limit;
+        # an empty cache (focus checks disabled) just means nobody looked
+        if (
+            self._focus_cache_hwnd is not None
+            and time.monotonic() - self._focus_cache_ts < FOCUS_CACHE_TTL
+        ):
+            self._last_focus_time = 0.0
+        self.focus_window()
 
-    def publish(self, topic: str, data: Dict[str, Any]):
-        """Emit a message via MQTT."""
+    def publish(self, topic: str, data: Union[Dict[str, Any], bytes], qos: int = 0):
+        """Emit a message via MQTT.
+
+        Status and notification traffic is idempotent and defaults to QoS 0;
+        pass qos=1 for replies that must be delivered. Bytes payloads are
+        sent as-is.
+        """
         if self._mqtt_connected:
-            message = json.dumps(data)
-            self._mqtt_client.publish(topic, message, qos=1)
+            message = data if isinstance(data, bytes) else json_dumps(data)
+            self._mqtt_client.publish(topic, message, qos=qos)
 
     def _update_play_status(self, status: str):
-        """Update the play_status state."""
-        state_msg = {"cmd": "update_state", "key": "play_status", "value": status}
-        self.publish("STATE", state_msg)
+        """Update the play_status state, skipping a repeat of the last known status."""
+        if status == self._last_published_status or not self._mqtt_connected:
+            return
+        message = STATUS_MESSAGES.get(status)
+        if message is None:
+            message = json_dumps({"cmd": "update_state", "key": "play_status", "value": status})
+        self._last_published_status = status
+        self.publish("STATE", message)
         logger.debug(f"Updated play_status to '{status}'")
 
     def _reset_to_beginning(self):
         """Reset tokens to beginning of file."""
-        if self.original_text_tokens:
-            self.text_tokens = self.original_text_tokens.copy()
-            self.text_tokens_preview = ['[ ' + str(x) + ' ]' for x in self.original_text_tokens]
+        if self.text_tokens:
+            # Tokens are never mutated during playback, so rewinding the cursor is enough
+            self._token_cursor = 0
             logger.info("Reset to beginning of file")
         else:
-            logger.warning("No original tokens to reset to")
+            logger.warning("No tokens to reset to")
+
+    def start(self, background_loop: bool = True):
+        """Start the Typer and connect to MQTT.
 
-    def start(self):
-        """Start the Typer and connect to MQTT."""
+        Args:
+            background_loop: Run the MQTT network loop on paho's own thread. Pass
+                False and call run_forever() to run it on the calling thread instead.
+        """
         if self._running:
             logger.info("Typer already running")
             return
@@ -580,13 +902,49 @@ class Typer:
         # Connect to MQTT broker
         try:
             self._mqtt_client.connect(self._mqtt_host, self._mqtt_port, keepalive=60)
-            self._mqtt_client.loop_start()
+            if background_loop:
+                self._mqtt_client.loop_start()
             logger.info(f"Typer connecting to MQTT broker on port {self._mqtt_port}")
         except Exception as e:
             logger.error(f"Failed to connect to MQTT broker: {e}")
             self._running = False
             return
 
+        self._cmd_thread = threading.Thread(target=self._command_worker, daemon=True)
+        self._cmd_thread.start()
+
+        # A timer rather than a queued wait, so TYPER commands aren't held up behind it
+        self._seed_timer = threading.Timer(STATE_SEED_TIMEOUT, self._check_state_seed)
+        self._seed_timer.daemon = True
+        self._seed_timer.start()
+
+    def run_forever(self):
+        """Run the MQTT network loop on the calling thread until stop() disconnects."""
+        self._mqtt_client.loop_forever()
+
+    def _check_state_seed(self):
+        """Ask for STATE once more if the initial request went unanswered
+        (e.g. the UI was not subscribed yet)."""
+        if self._running and not self._state_ready.is_set():
+            logger.warning("No STATE received yet, requesting it again")
+            self._request_state()
+
+    def _request_state(self):
+        """Ask the UI to publish its current state-data on STATE."""
+        self.publish("STATE", {"cmd": "get"})
+
+    def _command_worker(self):
+        """Run queued command handlers until a None sentinel arrives."""
+        while True:
+            item = self._cmd_queue.get()
+            if item is None:
+                break
+            cmd, handler, cmd_data = item
+            try:
+                handler(cmd_data)
+            except Exception as e:
+                logger.error(f"Error handling command {cmd}: {e}")
+
     def stop(self):
         """Stop the Typer."""
         if not self._running:
@@ -594,8 +952,16 @@ class Typer:
 
         self._running = False
         self.play = False
+        self._resume_event.set()
+        self._advance_event.set()
+
+        if self._seed_timer:
+            self._seed_timer.cancel()
 
-        # Stop MQTT client
+        # Let the command worker drain and exit
+        self._cmd_queue.put(None)
+
+        # Stop MQTT client (loop_stop is a no-op when the loop runs in run_forever)
         if self._mqtt_client:
             self._mqtt_client.loop_stop()
             self._mqtt_client.disconnect()
@@ -631,13 +997,19 @@ def typer_process(host:str, port: int, enable_logging: bool = True):
         logger.disable("ghost_coder")
 
     logger.info("Starting Typer process")
+
+    # pynput and pygetwindow call Win32 through ctypes, which already drops the
+    # GIL around each call. What remains is the interpreter's 5 ms switch
+    # interval, so shorten it to let the MQTT loop in promptly during playback.
+    sys.setswitchinterval(TYPER_SWITCH_INTERVAL)
+
     typer = Typer(mqtt_host = host, mqtt_port=port)
-    typer.start()
+    # The main thread would otherwise only idle, so it runs the MQTT network loop
+    typer.start(background_loop=False)
 
     try:
-        # Keep the process running
-        while typer.is_running():
-            time.sleep(1)
+        if typer.is_running():
+            typer.run_forever()
     except KeyboardInterrupt:
         logger.info("Typer interrupted")
     finally:
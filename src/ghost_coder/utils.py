@@ -1,13 +1,15 @@
 import socket
 
-def get_random_available_port() -> int:
+def get_random_available_port(host: str = "127.0.0.1") -> int:
     """
     Creates a temporary socket, binds it to port 0 to let the OS
     assign a free port, and returns the assigned port number.
     For most OS, binding to 0 will return an available port.
+
+    The port is released before returning, so another process could take
+    it before the caller binds; bind it promptly. The default host keeps the
+    probe on loopback rather than binding on all interfaces.
     """
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.bind(('', 0))  # Bind to an available port (OS assigns 0)
-        port = int(s.getsockname()[1])
-        s.close()
-        return port
+        s.bind((host, 0))  # Bind to an available port (OS assigns 0)
+        return int(s.getsockname()[1])